@@ -1,9 +1,188 @@
+import os
+import sqlite3
 import secrets
-from fastapi import FastAPI
+import time
+import queue
+import asyncio
+import logging
+from datetime import datetime, timezone
+from typing import Optional, Dict, Any
+from base64 import urlsafe_b64encode as _b64
+from collections import defaultdict
+from contextlib import contextmanager
+
+import uvicorn
+from fastapi import FastAPI, HTTPException, Response, Cookie
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, FileResponse, ORJSONResponse
 from pydantic import BaseModel
+import httpx
+import orjson
+
+# Configuration
+APP_SECRET = os.getenv("APP_SECRET", "change-me-in-prod")
+PAIR_TTL_SECONDS = int(os.getenv("PAIR_TTL_SECONDS", "300"))
+SESSION_TTL_MINUTES = int(os.getenv("SESSION_TTL_MINUTES", "30"))
+ALLOWED_ORIGINS = os.getenv("ALLOWED_ORIGINS", "*").split(",")
+ENVIRONMENT = os.getenv("ENVIRONMENT", "development")
+
+# Validate critical config
+if ENVIRONMENT == "production" and APP_SECRET == "change-me-in-prod":
+    raise ValueError("APP_SECRET must be set in production")
+
+DB_PATH = os.getenv("DB_PATH", "app.db")
+os.makedirs(os.path.dirname(DB_PATH) if os.path.dirname(DB_PATH) else ".", exist_ok=True)
+
+# Logging setup
+logging.basicConfig(
+    level=logging.INFO if ENVIRONMENT == "production" else logging.DEBUG,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+def now_utc() -> datetime:
+    return datetime.now(timezone.utc)
+
+# ---------- Database ----------
+# Dual pool: one RW connection for the rare pairing/module writes, plus an
+# N-sized read-only pool so /device/config polls never queue behind a writer
+# (WAL allows concurrent readers while a write is in flight).
+READ_POOL_SIZE = int(os.getenv("READ_POOL_SIZE", str(os.cpu_count() or 4)))
+
+def _configure(conn: sqlite3.Connection) -> sqlite3.Connection:
+    """Apply per-connection tuning; every pooled connection passes through here."""
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA busy_timeout=5000")
+    conn.execute("PRAGMA cache_size=-20000")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA mmap_size=134217728")
+    conn.execute("PRAGMA foreign_keys=ON")
+    conn.execute("PRAGMA wal_autocheckpoint=1000")
+    return conn
+
+def _open_write_conn() -> sqlite3.Connection:
+    # timeout backs SQLite's own busy handler set via PRAGMA busy_timeout;
+    # isolation_level=None so get_write_conn controls transactions explicitly
+    return _configure(sqlite3.connect(DB_PATH, timeout=5.0, check_same_thread=False,
+                                      isolation_level=None, cached_statements=256))
+
+def _open_read_conn() -> sqlite3.Connection:
+    return _configure(sqlite3.connect(f"file:{DB_PATH}?mode=ro", uri=True, timeout=5.0,
+                                      check_same_thread=False, cached_statements=256))
+
+# Hot-path SQL as module constants so the per-connection statement cache
+# always sees the identical string
+SQL_GET_DEVICE_BY_UID = "SELECT id, device_token FROM device WHERE hardware_uid=?"
+SQL_INSERT_DEVICE = "INSERT INTO device (id, hardware_uid, device_token, created_at) VALUES (?, ?, ?, ?)"
+SQL_SET_DEVICE_TOKEN = "UPDATE device SET device_token=? WHERE id=?"
+SQL_INSERT_PAIRING = "INSERT OR IGNORE INTO pairing (pair_code, device_id, expires_at, claimed_at) VALUES (?, ?, ?, NULL)"
+SQL_GET_PAIRING = "SELECT device_id, expires_at, claimed_at FROM pairing WHERE pair_code=?"
+SQL_INSERT_SESSION = "INSERT INTO session (session_token, device_id, expires_at) VALUES (?, ?, ?)"
+SQL_CLAIM_PAIRING = "UPDATE pairing SET claimed_at=? WHERE pair_code=?"
+SQL_GET_SESSION = "SELECT device_id FROM session WHERE session_token=? AND expires_at > strftime('%s','now')"
+SQL_UPSERT_MODULE = (
+    "INSERT INTO module (device_id, type, params_json, updated_at) VALUES (?, ?, ?, ?) "
+    "ON CONFLICT(device_id) DO UPDATE SET type=excluded.type, params_json=excluded.params_json, updated_at=excluded.updated_at"
+)
+SQL_GET_CONFIG = (
+    "SELECT d.id, m.type, m.params_json, m.updated_at FROM device d "
+    "LEFT JOIN module m ON m.device_id=d.id WHERE d.device_token=?"
+)
+
+def init_db() -> None:
+    """Initialize database schema (must run before the read pool opens mode=ro)."""
+    conn = _open_write_conn()
+    conn.executescript(
+        """
+        CREATE TABLE IF NOT EXISTS device (
+            id TEXT PRIMARY KEY,
+            hardware_uid TEXT UNIQUE,
+            device_token TEXT,
+            created_at TEXT
+        );
+        CREATE TABLE IF NOT EXISTS pairing (
+            pair_code TEXT PRIMARY KEY,
+            device_id TEXT,
+            expires_at INTEGER,
+            claimed_at TEXT
+        );
+        CREATE INDEX IF NOT EXISTS idx_pairing_expires ON pairing(expires_at);
+        CREATE TABLE IF NOT EXISTS module (
+            device_id TEXT PRIMARY KEY,
+            type TEXT,
+            params_json TEXT,
+            updated_at TEXT
+        );
+        CREATE TABLE IF NOT EXISTS session (
+            session_token TEXT PRIMARY KEY,
+            device_id TEXT,
+            expires_at INTEGER
+        );
+        CREATE INDEX IF NOT EXISTS idx_session_expires ON session(expires_at);
+        -- purge rows from before expires_at switched to epoch integers
+        DELETE FROM pairing WHERE typeof(expires_at)='text';
+        DELETE FROM session WHERE typeof(expires_at)='text';
+        DROP INDEX IF EXISTS idx_device_token;
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_device_token ON device(device_token);
+        ANALYZE;
+        """
+    )
+    conn.commit()
+    conn.close()
+
+init_db()
+
+# Size-1 queue hands the writer to one request at a time without a process-wide
+# mutex; cross-process writers are coordinated by SQLite itself via busy_timeout.
+_write_pool: "queue.Queue[sqlite3.Connection]" = queue.Queue(maxsize=1)
+_write_pool.put(_open_write_conn())
+_read_pool: "queue.Queue[sqlite3.Connection]" = queue.Queue(maxsize=READ_POOL_SIZE)
+for _ in range(READ_POOL_SIZE):
+    _read_pool.put(_open_read_conn())
+
+@contextmanager
+def get_write_conn():
+    """Borrow the RW connection inside a BEGIN IMMEDIATE transaction.
+
+    Grabbing the reserved write lock up-front means the read-then-write
+    sequences in pair_start/pair_claim can't race another writer and
+    upgrade mid-transaction (the classic SQLITE_BUSY deadlock pattern).
+    """
+    conn = _write_pool.get()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        yield conn
+        conn.execute("COMMIT")
+    except Exception:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+    finally:
+        _write_pool.put(conn)
+
+@contextmanager
+def get_read_conn():
+    """Borrow a read-only connection from the pool; safe for concurrent use."""
+    conn = _read_pool.get()
+    try:
+        yield conn
+    finally:
+        _read_pool.put(conn)
 
-app = FastAPI(title="ESP32 Test API")
+app = FastAPI(title="ESP32 Display API", version="0.2.1", default_response_class=ORJSONResponse)
 
+# CORS
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=ALLOWED_ORIGINS,
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+
+# ---------- Models ----------
 class PairStartIn(BaseModel):
     hardware_uid: str
 
@@ -13,26 +192,396 @@ class PairStartOut(BaseModel):
     device_id: str
     expires_in: int
 
+class PairClaimIn(BaseModel):
+    pair_code: str
+
+class PairClaimOut(BaseModel):
+    device_id: str
+
+class ModuleIn(BaseModel):
+    type: str
+    params: Dict[str, Any] = {}
+
+# ---------- Helpers ----------
+def generate_id(prefix="dev") -> str:
+    return f"{prefix}_{_b64(os.urandom(9)).rstrip(b'=').decode('ascii')}"
+
+def generate_code() -> str:
+    # 6-char hex code: same length on screen, ~16.7M keyspace vs 1M for
+    # digits, so the allocation loop practically never retries
+    return secrets.token_hex(3).upper()
+
+def generate_token(nbytes=24) -> str:
+    # what token_urlsafe does, minus the wrapper frames on the pairing path
+    return _b64(os.urandom(nbytes)).rstrip(b"=").decode("ascii")
+
+def _wrap_text_lines(params: Dict[str, Any]) -> list:
+    """Split a text module's message into display lines (max 4)."""
+    msg = str(params.get("message", "")).strip()
+    if not msg:
+        msg = "Hello from ESP32!"
+    width = int(params.get("max_chars", 16))
+    return [msg[i:i+width] for i in range(0, len(msg), width)][:4]
+
+def get_session_device_id(sess: Optional[str]) -> str:
+    if not sess:
+        raise HTTPException(status_code=401, detail="No session")
+    with get_read_conn() as conn:
+        row = conn.execute(SQL_GET_SESSION, (sess,)).fetchone()
+    if not row:
+        raise HTTPException(status_code=401, detail="Invalid or expired session")
+    return row["device_id"]
+
+# Long-lived HTTP client: connection pooling + HTTP/2 so cache-miss fetches
+# reuse a warm TLS session instead of paying a handshake per call
+HTTP = httpx.AsyncClient(
+    http2=True,
+    timeout=httpx.Timeout(8.0),
+    limits=httpx.Limits(max_keepalive_connections=20, max_connections=50),
+)
+
+@app.on_event("shutdown")
+async def _close_http():
+    await HTTP.aclose()
+
+# Cache for external APIs. Per-key locks coalesce concurrent cache misses so
+# a fleet of devices polling at once costs one upstream fetch, not N.
+CACHE: Dict[str, Dict[str, Any]] = {}
+_fetch_locks: Dict[str, asyncio.Lock] = defaultdict(asyncio.Lock)
+
+# Rendered /device/config responses for modules whose payload only changes
+# when the user reconfigures them, keyed on the module's updated_at stamp.
+# Stored pre-serialized so cache hits skip response encoding entirely.
+CONFIG_CACHE: Dict[str, tuple] = {}
+
+_NOT_CONFIGURED_RESPONSE = Response(
+    content=orjson.dumps({
+        "render": {"lines": ["Not configured", "Pick module in web UI"], "ttl": 15},
+        "next_poll_sec": 10,
+    }),
+    media_type="application/json",
+)
+
+def cache_get(key: str) -> Optional[Dict[str, Any]]:
+    item = CACHE.get(key)
+    if not item or item["expires_at"] < time.time():
+        return None
+    return item["value"]
+
+def cache_set(key: str, value: Dict[str, Any], ttl: int):
+    CACHE[key] = {"value": value, "expires_at": time.time() + ttl}
+
+# ---------- External data fetchers ----------
+# BTC price is refreshed by a single background task (push model), so request
+# handlers only ever read the cache and upstream sees one fetch per interval
+# no matter how many devices poll.
+BTC_REFRESH_SECONDS = 10
+
+async def _fetch_btc_price() -> None:
+    # CoinGecko simple price (no key)
+    url = "https://api.coingecko.com/api/v3/simple/price"
+    params = {"ids": "bitcoin", "vs_currencies": "usd", "include_24hr_change": "true"}
+    r = await HTTP.get(url, params=params)
+    r.raise_for_status()
+    data = r.json()
+    price = float(data["bitcoin"]["usd"])
+    chg = float(data["bitcoin"].get("usd_24h_change", 0.0))
+    # TTL outlives a couple of missed refreshes so a transient upstream blip
+    # serves the last known price instead of an error
+    cache_set("btc_price", {"price_usd": price, "change_24h": chg}, ttl=BTC_REFRESH_SECONDS * 3)
+
+async def _btc_refresher():
+    while True:
+        try:
+            await _fetch_btc_price()
+        except Exception as e:
+            logger.warning(f"BTC price refresh failed: {e}")
+        await asyncio.sleep(BTC_REFRESH_SECONDS)
+
+@app.on_event("startup")
+async def _start_btc_refresher():
+    global _btc_task
+    _btc_task = asyncio.create_task(_btc_refresher())
+
+# Expired pairing codes and sessions are swept periodically so the expiry
+# indexes stay shallow instead of growing forever
+SWEEP_INTERVAL_SECONDS = int(os.getenv("SWEEP_INTERVAL_SECONDS", "300"))
+
+def _sweep_expired() -> None:
+    with get_write_conn() as conn:
+        conn.execute("DELETE FROM pairing WHERE expires_at < strftime('%s','now')")
+        conn.execute("DELETE FROM session WHERE expires_at < strftime('%s','now')")
+
+def _optimize() -> None:
+    with get_write_conn() as conn:
+        conn.execute("PRAGMA optimize")
+
+async def _sweeper():
+    ticks = 0
+    while True:
+        await asyncio.sleep(SWEEP_INTERVAL_SECONDS)
+        try:
+            await asyncio.to_thread(_sweep_expired)
+            ticks += 1
+            if ticks % 12 == 0:  # roughly hourly
+                await asyncio.to_thread(_optimize)
+        except Exception as e:
+            logger.warning(f"Cleanup sweep failed: {e}")
+
+@app.on_event("startup")
+async def _start_sweeper():
+    global _sweeper_task
+    _sweeper_task = asyncio.create_task(_sweeper())
+
+async def get_btc_price() -> Dict[str, Any]:
+    cached = cache_get("btc_price")
+    if cached:
+        return cached
+    raise RuntimeError("BTC price not available yet")
+
+async def get_weather(city: str) -> Dict[str, Any]:
+    # For simplicity, expect "City,CC". We'll use Open-Meteo's geocoding to get lat/lon
+    key = f"wx_{city.lower()}"
+    cached = cache_get(key)
+    if cached:
+        return cached
+    async with _fetch_locks[key]:
+        cached = cache_get(key)
+        if cached:
+            return cached
+        return await _fetch_weather(city, key)
+
+async def _geocode(city: str) -> Dict[str, Any]:
+    # Geocoding results are effectively static, so the common weather refresh
+    # only pays for the forecast round trip
+    key = f"geo_{city.lower()}"
+    cached = cache_get(key)
+    if cached:
+        return cached
+    geo = await HTTP.get("https://geocoding-api.open-meteo.com/v1/search", params={"name": city, "count": 1})
+    geo.raise_for_status()
+    g = geo.json()
+    if not g.get("results"):
+        raise HTTPException(400, f"City not found: {city}")
+    out = {
+        "lat": g["results"][0]["latitude"],
+        "lon": g["results"][0]["longitude"],
+        "name": g["results"][0].get("name", city)
+    }
+    cache_set(key, out, ttl=86400)  # 24h cache
+    return out
+
+async def _fetch_weather(city: str, key: str) -> Dict[str, Any]:
+    geo = await _geocode(city)
+    wx = await HTTP.get(
+        "https://api.open-meteo.com/v1/forecast",
+        params={"latitude": geo["lat"], "longitude": geo["lon"], "current_weather": True}
+    )
+    wx.raise_for_status()
+    w = wx.json()
+    cw = w.get("current_weather", {})
+    out = {
+        "temp_c": cw.get("temperature"),
+        "windspeed_kph": cw.get("windspeed"),
+        "condition_code": cw.get("weathercode"),
+        "city": geo["name"]
+    }
+    cache_set(key, out, ttl=300)  # 5 min cache
+    return out
+
+@app.on_event("startup")
+async def _warm_geocode_cache():
+    """Prefetch geocoding for cities already configured so the first weather
+    poll after a restart skips straight to the forecast call."""
+    with get_read_conn() as conn:
+        rows = conn.execute("SELECT params_json FROM module WHERE type='weather'").fetchall()
+    cities = {orjson.loads(r["params_json"] or "{}").get("city", "Portland,US") for r in rows}
+    if cities:
+        await asyncio.gather(*(_geocode(c) for c in cities), return_exceptions=True)
+
+# ---------- Routes ----------
 @app.post("/pair/start", response_model=PairStartOut)
 def pair_start(inp: PairStartIn):
-    # No database - just generate and return
-    return PairStartOut(
-        pair_code=f"{secrets.randbelow(1000000):06d}",
-        device_token=secrets.token_urlsafe(24),
-        device_id=f"dev_{secrets.token_urlsafe(9)}",
-        expires_in=300
-    )
+    logger.info(f"Pairing start requested for hardware_uid: {inp.hardware_uid}")
+    with get_write_conn() as conn:
+        cur = conn.cursor()
+        # Ensure device exists or create. Keep the existing token if there is
+        # one: rotating on every pair_start invalidated long-lived devices on
+        # restart and made this read-mostly path do an extra write.
+        row = cur.execute(SQL_GET_DEVICE_BY_UID, (inp.hardware_uid,)).fetchone()
+        if row:
+            device_id = row["id"]
+            device_token = row["device_token"]
+            if not device_token:
+                device_token = generate_token(24)
+                cur.execute(SQL_SET_DEVICE_TOKEN, (device_token, device_id))
+        else:
+            device_id = generate_id("dev")
+            device_token = generate_token(24)
+            cur.execute(SQL_INSERT_DEVICE, (device_id, inp.hardware_uid, device_token, now_utc().isoformat()))
+
+        # Create a unique 6-digit code: INSERT OR IGNORE rides the primary-key
+        # constraint, so each attempt is one statement instead of SELECT + INSERT
+        expires_at = int(time.time()) + PAIR_TTL_SECONDS
+        for _ in range(5):
+            pair_code = generate_code()
+            cur.execute(SQL_INSERT_PAIRING, (pair_code, device_id, expires_at))
+            if cur.rowcount == 1:
+                break
+        else:
+            raise HTTPException(500, "Failed to allocate pair code")
+    logger.info(f"Generated pair code {pair_code} for device {device_id}")
+    return PairStartOut(pair_code=pair_code, device_token=device_token, device_id=device_id, expires_in=PAIR_TTL_SECONDS)
+
+@app.post("/pair/claim", response_model=PairClaimOut)
+def pair_claim(inp: PairClaimIn, response: Response = None):
+    pair_code = inp.pair_code.strip().upper()
+    with get_write_conn() as conn:
+        cur = conn.cursor()
+        row = cur.execute(SQL_GET_PAIRING, (pair_code,)).fetchone()
+        if not row:
+            raise HTTPException(400, "Invalid code")
+        if row["claimed_at"] is not None:
+            raise HTTPException(400, "Code already claimed")
+        if row["expires_at"] < int(time.time()):
+            raise HTTPException(400, "Code expired")
+
+        device_id = row["device_id"]
+        # Create a web session
+        sess = generate_token(24)
+        expires_at = int(time.time()) + SESSION_TTL_MINUTES * 60
+        cur.execute(SQL_INSERT_SESSION, (sess, device_id, expires_at))
+        cur.execute(SQL_CLAIM_PAIRING, (now_utc().isoformat(), pair_code))
+
+    # Set cookie
+    if response is not None:
+        response.set_cookie("sess", sess, max_age=SESSION_TTL_MINUTES*60, httponly=True, samesite="Lax")
+    return PairClaimOut(device_id=device_id)
+
+@app.post("/device/{device_id}/module")
+def set_module(device_id: str, mod: ModuleIn, sess: Optional[str] = Cookie(default=None)):
+    # Auth via session cookie
+    sess_device_id = get_session_device_id(sess)
+    if sess_device_id != device_id:
+        raise HTTPException(403, "Session not authorized for this device")
+    if mod.type not in {"text", "btc_price", "weather"}:
+        raise HTTPException(400, "Unsupported module type")
+    if mod.type == "text":
+        # Wrap once at write time; polls then serve the stored lines verbatim
+        try:
+            mod.params["lines"] = _wrap_text_lines(mod.params)
+        except (TypeError, ValueError):
+            raise HTTPException(400, "Invalid max_chars")
+
+    with get_write_conn() as conn:
+        conn.execute(SQL_UPSERT_MODULE, (device_id, mod.type, orjson.dumps(mod.params).decode(), now_utc().isoformat()))
+    CONFIG_CACHE.pop(device_id, None)
+    return {"ok": True}
+
+def _fetch_device_module(device_token: str):
+    """Blocking device + module lookup; must run off the event loop (asyncio.to_thread).
+
+    Single LEFT JOIN so the poll path is one statement; m.type is NULL when
+    the device has no module configured yet.
+    """
+    with get_read_conn() as conn:
+        row = conn.execute(SQL_GET_CONFIG, (device_token,)).fetchone()
+    if not row:
+        return None, None
+    return row["id"], (row if row["type"] is not None else None)
+
+@app.get("/device/config")
+async def device_config(device_token: str):
+    # Auth via device token; DB work happens on a worker thread so the loop
+    # stays free for the httpx fetches of other in-flight requests
+    device_id, mrow = await asyncio.to_thread(_fetch_device_module, device_token)
+    if device_id is None:
+        raise HTTPException(401, "Invalid device token")
+
+    if not mrow:
+        # Not configured yet: constant body, serialized once at import
+        return _NOT_CONFIGURED_RESPONSE
+
+    mtype = mrow["type"]
+    if mtype == "text":
+        # Steady-state text renders are pure functions of the module row;
+        # serve the memoized response until set_module bumps updated_at
+        cached = CONFIG_CACHE.get(device_id)
+        if cached and cached[0] == mrow["updated_at"]:
+            return cached[1]
+
+    params = orjson.loads(mrow["params_json"] or "{}")
+    lines = []
+    ttl = 15
+    next_poll = 10
+    render_ok = True
+
+    try:
+        if mtype == "text":
+            lines = params.get("lines")
+            if lines is None:
+                # legacy rows stored only the raw message; wrap on the fly
+                lines = _wrap_text_lines(params)
+            ttl = 60
+            next_poll = 15
+
+        elif mtype == "btc_price":
+            data = await get_btc_price()
+            price = data["price_usd"]
+            chg = data["change_24h"]
+            sign = "+" if chg >= 0 else ""
+            lines = [f"BTC ${price:,.0f}", f"24h {sign}{chg:.2f}%"]
+            ttl = 12
+            next_poll = 10
+
+        elif mtype == "weather":
+            city = params.get("city", "Portland,US")
+            data = await get_weather(city)
+            temp = data.get("temp_c")
+            wind = data.get("windspeed_kph")
+            lines = [data.get("city", city), f"{temp}°C  Wind {wind}"]
+            ttl = 300
+            next_poll = 60
+
+    except Exception as e:
+        # Return error line, short TTL to retry
+        logger.error(f"Error rendering module {mtype}: {e}")
+        lines = ["Err fetching data", str(e)[:18]]
+        ttl = 5
+        next_poll = 5
+        render_ok = False
+
+    resp = {"render": {"lines": lines, "ttl": ttl}, "next_poll_sec": next_poll}
+    if mtype == "text" and render_ok:
+        cached = Response(content=orjson.dumps(resp), media_type="application/json")
+        CONFIG_CACHE[device_id] = (mrow["updated_at"], cached)
+        return cached
+    return resp
 
 @app.get("/healthz")
 def healthz():
-    return {"ok": True, "version": "test"}
+    try:
+        with get_read_conn() as conn:
+            conn.execute("SELECT 1").fetchone()
+        return {"ok": True}
+    except Exception as e:
+        logger.error(f"Health check failed: {e}")
+        raise HTTPException(status_code=503, detail="Service unhealthy")
 
+# Serve the minimal web UI if hosted together
 @app.get("/")
 def root():
-    return {"message": "Test API - No Database", "working": True}
+    if not os.path.exists("web/index.html"):
+        return JSONResponse(
+            status_code=404,
+            content={"error": "Web UI not available"}
+        )
+    return FileResponse("web/index.html")
 
 if __name__ == "__main__":
-    import uvicorn
-    import os
     port = int(os.getenv("PORT", "8000"))
-    uvicorn.run("main:app", host="0.0.0.0", port=port)
\ No newline at end of file
+    # One worker per core (min 2). Each worker opens its own read pool and
+    # writer; WAL mode is persistent in the DB file and OS-level file locks
+    # coordinate writers across processes, so this is safe to scale out.
+    workers = int(os.getenv("WEB_CONCURRENCY", str(max(2, os.cpu_count() or 2))))
+    uvicorn.run("main:app", host="0.0.0.0", port=port, workers=workers, reload=False)
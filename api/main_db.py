@@ -1,111 +1,233 @@
 import os
-import sqlite3
-import secrets
-from datetime import datetime, timedelta, timezone
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
+import base64
+import time
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from threading import local
+from fastapi import FastAPI, Response
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel, ConfigDict
+import aiosqlite
+import orjson
 
 # Minimal config
 DB_PATH = os.getenv("DB_PATH", "/tmp/app.db")
-app = FastAPI(title="ESP32 Display API Minimal", version="0.1.0")
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"))
+LOG = logging.getLogger("pair")
 
-def now_utc() -> datetime:
-    return datetime.now(timezone.utc)
+# Single-writer discipline on the event loop: one long-lived aiosqlite
+# connection guarded by an asyncio.Lock, so pair bursts pipeline without
+# FastAPI thread-pool hops
+_write_lock = asyncio.Lock()
 
-def init_db():
-    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
-    conn.row_factory = sqlite3.Row
-    cur = conn.cursor()
-    cur.execute("""
+# SQL pinned as module constants so sqlite3's per-connection statement cache
+# hits the identical string every request instead of re-parsing
+_SQL_UPSERT_DEVICE = (
+    "INSERT INTO device (id, hardware_uid, device_token, created_at) VALUES (?, ?, ?, ?) "
+    "ON CONFLICT(hardware_uid) DO UPDATE SET device_token=excluded.device_token "
+    "RETURNING id"
+)
+_SQL_SET_TOKEN = "UPDATE device SET device_token=? WHERE id=?"
+_SQL_INSERT_PAIRING = "INSERT OR REPLACE INTO pairing (pair_code, device_id, expires_at, claimed_at) VALUES (?, ?, ?, ?)"
+
+# hardware_uid -> device_id for repeat pairings (a fixed MAC retries often);
+# a hit turns the device upsert into a plain indexed UPDATE. Loop-confined,
+# so no lock needed; cleared wholesale when it hits the cap.
+_device_cache: dict = {}
+_DEVICE_CACHE_MAX = 1024
+
+# Group commit: handlers enqueue pairing rows and a single flusher task
+# batches them into one BEGIN/COMMIT, so a burst of pairings shares one
+# fsync instead of paying one each
+_pair_q: asyncio.Queue = asyncio.Queue()
+_PAIR_BATCH_MAX = 128
+_PAIR_BATCH_WINDOW = 0.005  # seconds to let a burst accumulate
+
+async def _pair_flusher(db: aiosqlite.Connection):
+    while True:
+        items = [await _pair_q.get()]
+        await asyncio.sleep(_PAIR_BATCH_WINDOW)
+        while not _pair_q.empty() and len(items) < _PAIR_BATCH_MAX:
+            items.append(_pair_q.get_nowait())
+        rows = [row for row, _ in items]
+        futs = [fut for _, fut in items]
+        try:
+            async with _write_lock:
+                await db.execute("BEGIN IMMEDIATE")
+                await db.executemany(_SQL_INSERT_PAIRING, rows)
+                await db.execute("COMMIT")
+        except Exception as e:
+            if db.in_transaction:
+                await db.execute("ROLLBACK")
+            for fut in futs:
+                if not fut.done():
+                    fut.set_exception(e)
+            continue
+        for fut in futs:
+            if not fut.done():
+                fut.set_result(None)
+
+async def init_db(db: aiosqlite.Connection):
+    # Idempotency guard: workers that re-enter the lifespan (or test clients
+    # cycling the app) skip the redundant DDL against the shared WAL file
+    if getattr(init_db, "_done", False):
+        return
+    init_db._done = True
+    await db.execute("PRAGMA journal_mode=WAL")
+    await db.execute("PRAGMA synchronous=NORMAL")
+    await db.execute("PRAGMA busy_timeout=5000")
+    await db.execute("""
         CREATE TABLE IF NOT EXISTS device (
             id TEXT PRIMARY KEY,
             hardware_uid TEXT UNIQUE,
             device_token TEXT,
-            created_at TEXT
+            created_at INTEGER
         )
     """)
-    cur.execute("""
+    # WITHOUT ROWID stores the row in the pair_code B-tree itself, so a
+    # claim lookup (code -> device_id/expires_at) is one index-only walk; a
+    # separate covering index loses to the PK autoindex in the planner and
+    # would just tax every insert
+    await db.execute("""
         CREATE TABLE IF NOT EXISTS pairing (
             pair_code TEXT PRIMARY KEY,
             device_id TEXT,
-            expires_at TEXT,
-            claimed_at TEXT
-        )
+            expires_at INTEGER,
+            claimed_at INTEGER
+        ) WITHOUT ROWID
     """)
-    conn.commit()
-    conn.close()
+    await db.execute("ANALYZE")
 
-init_db()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # No row_factory: the only SELECT here reads a single column, and plain
+    # tuples skip the per-row Row allocation + name index
+    db = await aiosqlite.connect(DB_PATH, isolation_level=None, cached_statements=256)
+    await init_db(db)
+    app.state.db = db
+    flusher = asyncio.create_task(_pair_flusher(db))
+    yield
+    flusher.cancel()
+    await db.close()
+
+app = FastAPI(title="ESP32 Display API Minimal", version="0.1.0",
+              default_response_class=ORJSONResponse, lifespan=lifespan)
 
 class PairStartIn(BaseModel):
+    model_config = ConfigDict(extra="forbid", frozen=True)
+
     hardware_uid: str
 
-class PairStartOut(BaseModel):
-    pair_code: str
-    device_token: str
-    device_id: str
-    expires_in: int
+class _RandPool:
+    """Thread-local buffer of os.urandom bytes.
+
+    Amortizes the getrandom(2) syscall across hundreds of tokens instead of
+    paying it on every generate_* call.
+    """
+    def __init__(self, size: int = 4096):
+        self._size = size
+        self._local = local()
+
+    def take(self, n: int) -> bytes:
+        loc = self._local
+        buf = getattr(loc, "buf", None)
+        if buf is None or loc.off + n > len(buf):
+            loc.buf = buf = os.urandom(self._size)
+            loc.off = 0
+        out = buf[loc.off:loc.off + n]
+        loc.off += n
+        return out
+
+_pool = _RandPool()
+
+def _urlsafe(n: int) -> str:
+    # token_urlsafe minus the secrets wrapper frame and per-call urandom
+    return base64.urlsafe_b64encode(_pool.take(n)).rstrip(b"=").decode("ascii")
 
 def generate_id() -> str:
-    return f"dev_{secrets.token_urlsafe(9)}"
+    return f"dev_{_urlsafe(9)}"
 
 def generate_code() -> str:
-    return f"{secrets.randbelow(1000000):06d}"
+    # 20-bit mask + rejection: uniform over the 6-digit space without the
+    # modulo bias or randbelow's Python-level bit juggling (~4.8% rejects)
+    while True:
+        r = int.from_bytes(_pool.take(3), 'little') & 0xFFFFF
+        if r < 1000000:
+            return f"{r:06d}"
 
 def generate_token() -> str:
-    return secrets.token_urlsafe(24)
-
-@app.post("/pair/start", response_model=PairStartOut)
-def pair_start(inp: PairStartIn):
-    print(f"Pairing request for: {inp.hardware_uid}")
-    
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    cur = conn.cursor()
-    
-    # Get or create device
-    row = cur.execute("SELECT id FROM device WHERE hardware_uid=?", (inp.hardware_uid,)).fetchone()
-    if row:
-        device_id = row["id"]
-    else:
-        device_id = generate_id()
-        cur.execute(
-            "INSERT INTO device (id, hardware_uid, device_token, created_at) VALUES (?, ?, ?, ?)",
-            (device_id, inp.hardware_uid, "", now_utc().isoformat())
-        )
-    
+    return _urlsafe(24)
+
+# No response_model: the fields were just generated in-process, so Pydantic
+# re-validation would only add an allocation per request
+@app.post("/pair/start")
+async def pair_start(inp: PairStartIn):
+    # %-style args stay lazy: nothing is formatted unless DEBUG is on
+    LOG.debug("Pairing request for uid=%s", inp.hardware_uid)
+
+    db = app.state.db
     # Generate tokens
     device_token = generate_token()
     pair_code = generate_code()
-    
-    cur.execute("UPDATE device SET device_token=? WHERE id=?", (device_token, device_id))
-    
-    expires_at = (now_utc() + timedelta(seconds=300)).isoformat()
-    cur.execute(
-        "INSERT OR REPLACE INTO pairing (pair_code, device_id, expires_at, claimed_at) VALUES (?, ?, ?, ?)",
-        (pair_code, device_id, expires_at, None)
-    )
-    
-    conn.commit()
-    conn.close()
-    
-    print(f"Generated pair code: {pair_code}")
-    return PairStartOut(
-        pair_code=pair_code,
-        device_token=device_token,
-        device_id=device_id,
-        expires_in=300
-    )
+
+    device_id = _device_cache.get(inp.hardware_uid)
+    async with _write_lock:
+        if device_id is not None:
+            # Known device: skip the upsert's conflict machinery
+            await db.execute(_SQL_SET_TOKEN, (device_token, device_id))
+        else:
+            # Get-or-create plus token refresh in one statement: the upsert
+            # rides the UNIQUE(hardware_uid) constraint and RETURNING hands
+            # back the id either way (SQLite >= 3.35)
+            cur = await db.execute(
+                _SQL_UPSERT_DEVICE,
+                (generate_id(), inp.hardware_uid, device_token, int(time.time()))
+            )
+            device_id = (await cur.fetchone())[0]
+            if len(_device_cache) >= _DEVICE_CACHE_MAX:
+                _device_cache.clear()
+            _device_cache[inp.hardware_uid] = device_id
+
+    # The pairing insert rides the group-commit queue; the future resolves
+    # only after the flusher's COMMIT, so the code is durable when we return
+    expires_at = int(time.time()) + 300
+    fut = asyncio.get_running_loop().create_future()
+    await _pair_q.put(((pair_code, device_id, expires_at, None), fut))
+    await fut
+
+    LOG.debug("Generated pair code %s for device %s", pair_code, device_id)
+    return {
+        "pair_code": pair_code,
+        "device_token": device_token,
+        "device_id": device_id,
+        "expires_in": 300
+    }
+
+# Healthcheckers hit this every second per node; cache the formatted
+# timestamp so repeat hits inside the same second skip datetime entirely
+_hz_cache = [0, ""]
 
 @app.get("/healthz")
 def healthz():
-    return {"ok": True, "version": "minimal-v2", "timestamp": str(now_utc())}
+    t = int(time.time())
+    if t != _hz_cache[0]:
+        _hz_cache[0] = t
+        _hz_cache[1] = datetime.fromtimestamp(t, timezone.utc).isoformat()
+    return {"ok": True, "version": "minimal-v2", "timestamp": _hz_cache[1]}
+
+# Root body never changes: serialize once and hand back the same Response
+_ROOT_RESPONSE = Response(
+    content=orjson.dumps({"message": "ESP32 Display API - Minimal Version", "status": "working"}),
+    media_type="application/json",
+)
 
 @app.get("/")
 def root():
-    return {"message": "ESP32 Display API - Minimal Version", "status": "working"}
+    return _ROOT_RESPONSE
 
 if __name__ == "__main__":
     import uvicorn
     port = int(os.getenv("PORT", "8000"))
-    uvicorn.run("main:app", host="0.0.0.0", port=port)
\ No newline at end of file
+    uvicorn.run("main:app", host="0.0.0.0", port=port)